@@ -12,8 +12,8 @@ y.append(215)
 print "x",x
 print "y",y
 
-#M3 and M4 prevent this: print "sum of x and y",y+x
-#M3 and M4 prevent this: print "difference of x and y",x-y
+print "sum of x and y",y+x
+print "difference of x and y",x-y
 print "merge x and y",y.merge(x)
 
 print "ops"
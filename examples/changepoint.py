@@ -0,0 +1,32 @@
+from __future__ import print_function
+import random
+from livestat import *
+
+random.seed(1)
+
+def changed(detector,x):
+    print("-",detector,"change",detector.direction,"at",x)
+
+# mean shift at 500
+X = [random.gauss(10,1) for i in range(500)] + [random.gauss(12,1) for i in range(500)]
+
+s = LiveStat("x")
+for d in (Cusum(h=8,stat=s,callback=changed),PageHinkley(delta=0.5,threshold=20,callback=changed),ShiftDetector(window=50,callback=changed)):
+    print(d.__class__.__name__,"changes",d.extend(X))
+print(s)
+
+# the same detector over many metrics, the last metric shifts
+try:
+    import numpy
+except:
+    numpy = None
+if numpy is not None:
+    def bankchanged(bank,i,x):
+        print("- metric",i,"change",bank.direction[i],"at",x)
+    b = CusumBank(4,h=8,callback=bankchanged)
+    for i in range(1000):
+        v = [random.gauss(0,1) for j in range(4)]
+        if i >= 500:
+            v[3] += 3
+        b.update(v)
+    print("changes per metric",b.changes)
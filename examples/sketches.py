@@ -0,0 +1,61 @@
+from __future__ import print_function
+import random
+from livestat import *
+
+random.seed(1)
+
+# top-k of a skewed stream with bounded memory, one LiveStat per tracked key
+s = SpaceSaving(5,cz=LiveStat)
+for i in range(10000):
+    key = "page%d" % int(random.paretovariate(1.2))
+    s.append(key,random.random()*100)
+print(s)
+for key,count,error in s.top():
+    print("-",key,count,error,s[key])
+print("guaranteed top",s.guaranteed())
+
+# histogram keeping only the 5 most frequent cases
+h = Histogram("pages",cz=LiveStat,maxkeys=5)
+for i in range(10000):
+    h.append("page%d" % int(random.paretovariate(1.2)),random.random())
+print(h.bounded,"cases",h.top(3))
+
+# merge of the histogram of another worker: the other histogram is left untouched
+h2 = Histogram("pages",cz=LiveStat,maxkeys=5)
+h2.append("page1",0.5)
+h2.append("z",1.0)
+h.merge(h2)
+h2.append("z",99.0)
+print("merged",h.items["page1"].count,h2.items["page1"].count)
+assert h2.items["page1"].count == 1
+assert "z" not in h.items or h.items["z"].vmax < 99.0
+
+# distinct count of two workers merged
+a = HyperLogLog(12)
+b = HyperLogLog(12)
+a.extend(range(0,60000))
+b.extend(range(40000,100000))
+a.merge(HyperLogLog.frombytes(b.tobytes()))
+print(a,"exact 100000 error",a.error)
+
+x = LiveStat("x")
+x.trackdistinct(10)
+x.extend([random.randint(0,999) for i in range(5000)])
+print(x,"distinct",x.distinctcount)
+
+# autocorrelation of an AR(1) series
+l = LagStat(4)
+y = 0
+for i in range(5000):
+    y = 0.8*y + random.gauss(0,1)
+    l.append(y)
+print(l)
+print("Ljung-Box",l.ljungbox())
+
+# autocorrelation of the inter-arrival times
+d = DeltaLiveStat("t",maxlag=2)
+t = 0
+for i in range(1000):
+    t += 10 + random.random()
+    d.append(t)
+print(d,d.autocorrelation(1))
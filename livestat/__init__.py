@@ -7,5 +7,10 @@ In particular: count, mean, std, maximum and minimum, span
 
 """
 from livestat import *
+from heavyhitters import SpaceSaving
+from hyperloglog import HyperLogLog
+from lagstat import LagStat
+from changepoint import Cusum, PageHinkley, ShiftDetector, CusumBank, PageHinkleyBank, ShiftBank
 
-__all__ = ["LiveStat", "DeltaLiveStat","Counter","Histogram"]
+__all__ = ["LiveStat", "LiveStatSnapshot", "DeltaLiveStat","Counter","Histogram","SpaceSaving","HyperLogLog","LagStat",
+           "Cusum","PageHinkley","ShiftDetector","CusumBank","PageHinkleyBank","ShiftBank"]
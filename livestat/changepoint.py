@@ -0,0 +1,282 @@
+#
+# Online change-point detection
+#
+# Detectors with O(1) state per metric, fed with the same values of a LiveStat/DeltaLiveStat:
+#   - Cusum: two-sided CUSUM of the values standardized by the running mean/std since the last change
+#       g+ = max(0,g+ + z - k), g- = max(0,g- - z - k), change when g+ or g- > h
+#   - PageHinkley: cumulative deviation from the running mean, minus the tolerance delta
+#       m = sum (x - mean - delta), change when m - min(m) > threshold (and symmetric for decrease)
+#   - ShiftDetector: reference vs recent moments (incmoments tuples), every window values the Welch
+#       statistics of the means is tested, then the recent moments are merged into the reference
+#       (or replace it after a change)
+#
+# When a detector is constructed with a stat the values are also appended to it, and for a
+# DeltaLiveStat the detector works on the differences.
+# On change the callback(detector,x) is invoked and direction is +1 (increase) or -1 (decrease).
+#
+# The Bank classes run the same detectors over many metrics at once with numpy: update(values)
+# takes one value per metric (NaN for missing) and calls callback(bank,index,x) for each change.
+import math
+import incmoments
+try:
+    import numpy
+except:
+    numpy = None
+
+
+class ChangeDetector:
+    """Base class of the online change detectors
+
+    Subclasses define _update(x) returning true when a change is detected"""
+    def __init__(self,stat=None,callback=None):
+        self.stat = stat
+        self.callback = callback
+        self.changes = 0
+        self.direction = 0
+    def append(self,x):
+        """Adds a new value, returns true if a change is detected"""
+        if self.stat is not None:
+            n = self.stat.count
+            self.stat.append(x)
+            if hasattr(self.stat,"dlast"):
+                # DeltaLiveStat: work on the differences
+                if self.stat.count == n:
+                    return False
+                x = self.stat.dlast
+        return self._update(x)
+    def extend(self,data):
+        """Adds a sequence of values, returns the number of changes detected"""
+        r = 0
+        for x in data:
+            if self.append(x):
+                r += 1
+        return r
+    def _change(self,x,direction):
+        """Private: records a change and invokes the callback"""
+        self.changes += 1
+        self.direction = direction
+        if self.callback is not None:
+            self.callback(self,x)
+        return True
+
+
+class Cusum(ChangeDetector):
+    """Two-sided CUSUM on the running mean, k and h in units of standard deviation"""
+    def __init__(self,k=0.5,h=5.0,warmup=30,stat=None,callback=None):
+        ChangeDetector.__init__(self,stat,callback)
+        self.k = k
+        self.h = h
+        self.warmup = warmup
+        self.reset()
+    def reset(self):
+        """Resets the detector state, not the stat"""
+        self.ref = incmoments.pmomentsempty(2)
+        self.gpos = 0.0
+        self.gneg = 0.0
+    def _update(self,x):
+        n = self.ref[0]
+        if n >= self.warmup and n > 1:
+            sigma = math.sqrt(self.ref[2]/(n-1))
+            z = (x-self.ref[1])/sigma if sigma > 0 else 0.0
+            self.gpos = max(0.0,self.gpos+z-self.k)
+            self.gneg = max(0.0,self.gneg-z-self.k)
+            if self.gpos > self.h or self.gneg > self.h:
+                direction = 1 if self.gpos > self.h else -1
+                self.reset()
+                self.ref = incmoments.pmomentsofscalar(x,2)
+                return self._change(x,direction)
+        self.ref = incmoments.pmomentsaddscalar(self.ref,x)
+        return False
+    def __str__(self):
+        return "Cusum(mean=%s,g+=%s,g-=%s,changes=%d)" % (self.ref[1],self.gpos,self.gneg,self.changes)
+
+
+class PageHinkley(ChangeDetector):
+    """Two-sided Page-Hinkley test on the running mean, delta and threshold in units of the values"""
+    def __init__(self,delta=0.005,threshold=50.0,warmup=30,stat=None,callback=None):
+        ChangeDetector.__init__(self,stat,callback)
+        self.delta = delta
+        self.threshold = threshold
+        self.warmup = warmup
+        self.reset()
+    def reset(self):
+        """Resets the detector state, not the stat"""
+        self.n = 0
+        self.mean = 0.0
+        self.mpos = 0.0
+        self.mneg = 0.0
+        self.minpos = 0.0
+        self.minneg = 0.0
+    def _update(self,x):
+        self.n += 1
+        self.mean += (x-self.mean)/self.n
+        self.mpos += x-self.mean-self.delta
+        self.mneg += self.mean-x-self.delta
+        self.minpos = min(self.minpos,self.mpos)
+        self.minneg = min(self.minneg,self.mneg)
+        if self.n >= self.warmup:
+            if self.mpos-self.minpos > self.threshold:
+                self.reset()
+                return self._change(x,1)
+            if self.mneg-self.minneg > self.threshold:
+                self.reset()
+                return self._change(x,-1)
+        return False
+    def __str__(self):
+        return "PageHinkley(mean=%s,changes=%d)" % (self.mean,self.changes)
+
+
+class ShiftDetector(ChangeDetector):
+    """Reference vs recent window comparison of the means using two mergeable moment states"""
+    def __init__(self,window=100,threshold=4.0,stat=None,callback=None):
+        ChangeDetector.__init__(self,stat,callback)
+        self.window = window
+        self.threshold = threshold
+        self.reset()
+    def reset(self):
+        """Resets the detector state, not the stat"""
+        self.ref = incmoments.momentsempty()
+        self.recent = incmoments.momentsempty()
+        self.score = 0.0
+    def merge(self,other):
+        """Merges the reference of other, e.g. the same metric observed by another process"""
+        self.ref = incmoments.momentscombine(self.ref,other.ref)
+        return self
+    def _update(self,x):
+        self.recent = incmoments.momentsaddscalar(self.recent,x)
+        if self.recent[0] < self.window:
+            return False
+        recent = self.recent
+        self.recent = incmoments.momentsempty()
+        if self.ref[0] < 2:
+            self.ref = incmoments.momentscombine(self.ref,recent)
+            return False
+        self.score = welch(self.ref,recent)
+        if abs(self.score) > self.threshold:
+            self.ref = recent
+            return self._change(x,1 if self.score > 0 else -1)
+        self.ref = incmoments.momentscombine(self.ref,recent)
+        return False
+    def __str__(self):
+        return "ShiftDetector(mean=%s,score=%s,changes=%d)" % (self.ref[1],self.score,self.changes)
+
+
+def welch(mA,mB):
+    """Welch statistics of the difference of the means of mB with respect to mA (moments tuples)"""
+    nA = float(mA[0])
+    nB = float(mB[0])
+    s = mA[2]/(nA-1)/nA + mB[2]/(nB-1)/nB
+    if s <= 0:
+        return 0.0
+    return (mB[1]-mA[1])/math.sqrt(s)
+
+
+class DetectorBank:
+    """Base class of the vectorized detectors over n metrics, requires numpy
+
+    Subclasses define _update(x,valid) returning the boolean array of the changed metrics"""
+    def __init__(self,n,callback=None):
+        if numpy is None:
+            raise Exception("numpy missing: required by %s" % self.__class__.__name__)
+        self.n = n
+        self.callback = callback
+        self.changes = numpy.zeros(n,dtype=numpy.int64)
+        self.direction = numpy.zeros(n,dtype=numpy.int8)
+    def update(self,values):
+        """Adds one value per metric (NaN for none), returns the indices of the metrics that changed"""
+        x = numpy.asarray(values,dtype=numpy.float64)
+        valid = ~numpy.isnan(x)
+        changed = numpy.flatnonzero(self._update(numpy.where(valid,x,0.0),valid))
+        self.changes[changed] += 1
+        if self.callback is not None:
+            for i in changed:
+                self.callback(self,i,x[i])
+        return changed
+
+
+class CusumBank(DetectorBank):
+    """Cusum over n metrics"""
+    def __init__(self,n,k=0.5,h=5.0,warmup=30,callback=None):
+        DetectorBank.__init__(self,n,callback)
+        self.k = k
+        self.h = h
+        self.warmup = warmup
+        self.ref = numpy.zeros((3,n))
+        self.gpos = numpy.zeros(n)
+        self.gneg = numpy.zeros(n)
+    def _update(self,x,valid):
+        cnt,mean,m2 = self.ref
+        active = valid & (cnt >= self.warmup) & (cnt > 1)
+        sigma = numpy.sqrt(m2/numpy.maximum(cnt-1,1))
+        z = numpy.where(active & (sigma > 0),(x-mean)/numpy.where(sigma > 0,sigma,1.0),0.0)
+        self.gpos = numpy.where(active,numpy.maximum(0.0,self.gpos+z-self.k),self.gpos)
+        self.gneg = numpy.where(active,numpy.maximum(0.0,self.gneg-z-self.k),self.gneg)
+        up = self.gpos > self.h
+        changed = up | (self.gneg > self.h)
+        self.direction[changed] = numpy.where(up[changed],1,-1)
+        self.gpos[changed] = 0.0
+        self.gneg[changed] = 0.0
+        # the changed metrics restart from the current value
+        one = numpy.where(valid,1.0,0.0)
+        xs = numpy.vstack((one,x,numpy.zeros(self.n)))
+        self.ref[:,changed] = 0.0
+        self.ref = incmoments.pmomentscombinearray(self.ref,xs)
+        return changed
+
+
+class PageHinkleyBank(DetectorBank):
+    """PageHinkley over n metrics"""
+    def __init__(self,n,delta=0.005,threshold=50.0,warmup=30,callback=None):
+        DetectorBank.__init__(self,n,callback)
+        self.delta = delta
+        self.threshold = threshold
+        self.warmup = warmup
+        self.count = numpy.zeros(n)
+        self.mean = numpy.zeros(n)
+        self.mpos = numpy.zeros(n)
+        self.mneg = numpy.zeros(n)
+        self.minpos = numpy.zeros(n)
+        self.minneg = numpy.zeros(n)
+    def _update(self,x,valid):
+        self.count += valid
+        self.mean += numpy.where(valid,(x-self.mean)/numpy.maximum(self.count,1),0.0)
+        self.mpos += numpy.where(valid,x-self.mean-self.delta,0.0)
+        self.mneg += numpy.where(valid,self.mean-x-self.delta,0.0)
+        numpy.minimum(self.minpos,self.mpos,out=self.minpos)
+        numpy.minimum(self.minneg,self.mneg,out=self.minneg)
+        ready = valid & (self.count >= self.warmup)
+        up = ready & (self.mpos-self.minpos > self.threshold)
+        changed = up | (ready & (self.mneg-self.minneg > self.threshold))
+        self.direction[changed] = numpy.where(up[changed],1,-1)
+        for a in (self.count,self.mean,self.mpos,self.mneg,self.minpos,self.minneg):
+            a[changed] = 0.0
+        return changed
+
+
+class ShiftBank(DetectorBank):
+    """ShiftDetector over n metrics, the moments are kept as (3,n) arrays of (count,mean,M2)"""
+    def __init__(self,n,window=100,threshold=4.0,callback=None):
+        DetectorBank.__init__(self,n,callback)
+        self.window = window
+        self.threshold = threshold
+        self.ref = numpy.zeros((3,n))
+        self.recent = numpy.zeros((3,n))
+        self.score = numpy.zeros(n)
+    def _update(self,x,valid):
+        one = numpy.where(valid,1.0,0.0)
+        self.recent = incmoments.pmomentscombinearray(self.recent,numpy.vstack((one,x,numpy.zeros(self.n))))
+        full = self.recent[0] >= self.window
+        tested = full & (self.ref[0] >= 2)
+        nA = numpy.maximum(self.ref[0],2)
+        nB = numpy.maximum(self.recent[0],2)
+        s = self.ref[2]/(nA-1)/nA + self.recent[2]/(nB-1)/nB
+        score = numpy.where(s > 0,(self.recent[1]-self.ref[1])/numpy.sqrt(numpy.where(s > 0,s,1.0)),0.0)
+        self.score = numpy.where(tested,score,self.score)
+        changed = tested & (numpy.abs(score) > self.threshold)
+        self.direction[changed] = numpy.where(score[changed] > 0,1,-1)
+        # changed: reference replaced by recent, otherwise merged
+        self.ref[:,changed] = 0.0
+        merged = incmoments.pmomentscombinearray(self.ref,self.recent)
+        self.ref = numpy.where(full,merged,self.ref)
+        self.recent[:,full] = 0.0
+        return changed
@@ -0,0 +1,244 @@
+#
+# Bounded-memory heavy hitters
+#
+# Space-Saving summary (Metwally, Agrawal, El Abbadi 2005) keeping at most k keys.
+# Every tracked key stores (count,error,value):
+#   - count is an upper bound of the true weight of the key
+#   - count-error is a lower bound of the true weight of the key
+#   - value is an optional accumulator (e.g. LiveStat) receiving the samples of the key
+#     while it is tracked
+#
+# When a new key arrives and the summary is full, the key with the minimum count is evicted
+# and the new key inherits its count as error. Any untracked key has weight <= mincount.
+#
+# Two summaries can be merged (Agarwal et al. 2012, Mergeable Summaries): keys missing from
+# one side are assumed to have at most the minimum count of that side.
+import heapq
+import itertools
+from collections import defaultdict
+try:
+    import numpy
+except:
+    numpy = None
+
+
+class SpaceSaving:
+    """Top-k summary of a stream of keys with bounded memory and per key error bounds"""
+    def __init__(self,k,cz=None):
+        """Constructor with the maximum number of tracked keys and the optional value class"""
+        if k < 1:
+            raise Exception("SpaceSaving requires k >= 1")
+        self.k = k
+        self.cz = cz
+        self.reset()
+    def reset(self):
+        """Resets the summary"""
+        self.kcount = {}
+        self.kerror = {}
+        self.kvalue = {}
+        self.heap = []
+        self.seq = itertools.count()
+        self.total = 0
+        self.evicted = 0
+        self.evictedcount = 0
+    @property
+    def full(self):
+        """Returns true when k keys are tracked"""
+        return len(self.kcount) >= self.k
+    @property
+    def mincount(self):
+        """Returns the minimum tracked count, that is the maximum weight of any untracked key"""
+        if not self.full:
+            return 0
+        return self._min()[0]
+    @property
+    def outside(self):
+        """Returns an upper bound of the weight of the keys not attributed to the tracked set"""
+        return self.total - sum(self.kcount[x]-self.kerror[x] for x in self.kcount)
+    def __len__(self):
+        return len(self.kcount)
+    def __contains__(self,x):
+        return x in self.kcount
+    def __getitem__(self,x):
+        """Returns the value associated to the tracked key x"""
+        return self.kvalue[x]
+    def keys(self):
+        return self.kcount.keys()
+    def items(self):
+        return self.kvalue.items()
+    def values(self):
+        return self.kvalue.values()
+    def count(self,x):
+        """Returns the estimated (upper bound) weight of x"""
+        if x in self.kcount:
+            return self.kcount[x]
+        return self.mincount
+    def error(self,x):
+        """Returns the maximum overestimation of count(x)"""
+        if x in self.kcount:
+            return self.kerror[x]
+        return self.mincount
+    def bounds(self,x):
+        """Returns the (lower,upper) bounds of the weight of x"""
+        if x in self.kcount:
+            return (self.kcount[x]-self.kerror[x],self.kcount[x])
+        return (0,self.mincount)
+    def top(self,n=None):
+        """Returns the list of (key,count,error) sorted by decreasing count"""
+        r = sorted(((x,c,self.kerror[x]) for x,c in self.kcount.items()),key=lambda q: -q[1])
+        if n is not None:
+            r = r[0:n]
+        return r
+    def guaranteed(self,n=None):
+        """Returns the keys that are guaranteed to be in the top-n (n defaults to k)"""
+        t = self.top()
+        if n is None or n >= len(t):
+            n = len(t)
+        r = []
+        for i in range(0,n):
+            # the lower bound of the key has to beat the upper bound of the next candidate
+            nextc = t[i+1][1] if i+1 < len(t) else self.mincount
+            if t[i][1]-t[i][2] >= nextc:
+                r.append(t[i][0])
+            else:
+                break
+        return r
+    def _min(self):
+        """Private: returns the (count,key) with minimum count
+
+        Heap entries are refreshed lazily: counts only grow, so a stale entry is never above its key
+        """
+        while True:
+            c,i,x = self.heap[0]
+            cc = self.kcount[x]
+            if c == cc:
+                return c,x
+            heapq.heapreplace(self.heap,(cc,i,x))
+    def _evict(self):
+        """Private: evicts the key with the minimum count, returns its count"""
+        c,x = self._min()
+        heapq.heappop(self.heap)
+        self.evicted += c-self.kerror[x]
+        self.evictedcount += 1
+        del self.kcount[x]
+        del self.kerror[x]
+        del self.kvalue[x]
+        return c
+    def _insert(self,x,c,e,v=None):
+        """Private: tracks a new key"""
+        self.kcount[x] = c
+        self.kerror[x] = e
+        if v is None and self.cz is not None:
+            v = self.cz()
+        self.kvalue[x] = v
+        heapq.heappush(self.heap,(c,next(self.seq),x))
+    def add(self,x,w=1):
+        """Adds weight w to key x without touching its value"""
+        self.total += w
+        if x in self.kcount:
+            self.kcount[x] += w
+        elif not self.full:
+            self._insert(x,w,0)
+        else:
+            c = self._evict()
+            self._insert(x,c+w,c)
+    def append(self,x,y=1,w=1):
+        """Adds key x with weight w and appends y to the value of x"""
+        self.add(x,w)
+        v = self.kvalue[x]
+        if v is not None:
+            v.append(y)
+    def extend(self,keys,values=None):
+        """Batch update from a sequence of keys (unit weight) and optional values
+
+        Keys are aggregated before being pushed to the summary, which is equivalent to weighted
+        Space-Saving updates and keeps the same error guarantees. Without values every key
+        appends the value 1 to its accumulator, as append(x) does.
+        """
+        if values is None:
+            if numpy is not None and isinstance(keys,numpy.ndarray):
+                u,c = numpy.unique(keys,return_counts=True)
+                agg = zip(u.tolist(),c.tolist())
+            else:
+                agg = defaultdict(int)
+                for x in keys:
+                    agg[x] += 1
+                agg = agg.items()
+            # smallest first so that the large keys are the ones surviving in the summary
+            for x,c in sorted(agg,key=lambda q: q[1]):
+                self.add(x,c)
+                v = self.kvalue[x]
+                if v is None:
+                    continue
+                if hasattr(v,"extend"):
+                    v.extend([1]*c)
+                else:
+                    for i in range(0,c):
+                        v.append(1)
+        else:
+            groups = defaultdict(list)
+            for x,y in zip(keys,values):
+                groups[x].append(y)
+            for x,ys in sorted(groups.items(),key=lambda q: len(q[1])):
+                self.add(x,len(ys))
+                v = self.kvalue[x]
+                if v is None:
+                    continue
+                if hasattr(v,"extend"):
+                    v.extend(ys)
+                else:
+                    for y in ys:
+                        v.append(y)
+        return self
+    def merge(self,other):
+        """Merges the other summary into this one, the result tracks at most k keys"""
+        mA = self.mincount
+        mB = other.mincount
+        counts = {}
+        errors = {}
+        values = {}
+        for x,c in self.kcount.items():
+            counts[x] = c
+            errors[x] = self.kerror[x]
+            values[x] = self.kvalue[x]
+        for x,c in other.kcount.items():
+            if x in counts:
+                counts[x] += c
+                errors[x] += other.kerror[x]
+                v = values[x]
+                ov = other.kvalue[x]
+                if v is None:
+                    values[x] = self._mergedvalue(ov)
+                elif ov is not None:
+                    v.merge(ov)
+            else:
+                counts[x] = c + mA
+                errors[x] = other.kerror[x] + mA
+                values[x] = self._mergedvalue(other.kvalue[x])
+        for x in self.kcount:
+            if x not in other.kcount:
+                counts[x] += mB
+                errors[x] += mB
+        self.total += other.total
+        self.evicted += other.evicted
+        self.evictedcount += other.evictedcount
+        keep = sorted(counts.keys(),key=lambda x: -counts[x])
+        for x in keep[self.k:]:
+            self.evicted += counts[x]-errors[x]
+            self.evictedcount += 1
+        self.kcount = {}
+        self.kerror = {}
+        self.kvalue = {}
+        self.heap = []
+        for x in keep[0:self.k]:
+            self._insert(x,counts[x],errors[x],values[x])
+        return self
+    def _mergedvalue(self,ov):
+        """Private: new accumulator holding the value of the other summary, which stays untouched"""
+        if ov is None or self.cz is None:
+            return None
+        v = self.cz()
+        v.merge(ov)
+        return v
+    def __str__(self):
+        return "SpaceSaving(k=%d,tracked=%d,total=%s,outside=%s)" % (self.k,len(self.kcount),self.total,self.outside)
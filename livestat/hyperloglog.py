@@ -0,0 +1,182 @@
+#
+# Approximate distinct counting
+#
+# HyperLogLog (Flajolet et al. 2007) with 64 bit hashes and the linear counting correction
+# for small cardinalities (Heule et al. 2013). With precision p there are m=2^p one byte
+# registers (p=12 is 4KB) and the relative standard error is 1.04/sqrt(m).
+#
+# Hashing is deterministic across processes (no use of the builtin hash) so that sketches
+# built by different workers can be merged (register-wise max) without loss:
+#   - integers and floats: splitmix64 finalizer of the 64 bit representation
+#   - strings and other objects: md5 of the encoded value
+# Note that 1 and 1.0 are different values for the sketch.
+#
+# Serialization: tobytes() gives "HLL" + version byte + p byte + registers
+import hashlib
+import math
+import struct
+try:
+    import numpy
+except:
+    numpy = None
+
+try:
+    long
+except NameError:
+    long = int
+    unicode = str
+
+MASK64 = (1 << 64)-1
+HEADER = b"HLL"
+VERSION = 1
+
+def _mix64(z):
+    """splitmix64 finalizer over a 64 bit integer"""
+    z = ((z ^ (z >> 30))*0xbf58476d1ce4e5b9) & MASK64
+    z = ((z ^ (z >> 27))*0x94d049bb133111eb) & MASK64
+    return z ^ (z >> 31)
+
+def hash64(x):
+    """Deterministic 64 bit hash of a value"""
+    if numpy is not None and isinstance(x,numpy.generic):
+        x = x.item()
+    if isinstance(x,float):
+        return _mix64(struct.unpack("<Q",struct.pack("<d",x))[0])
+    elif isinstance(x,(int,long)):
+        return _mix64(x & MASK64)
+    if not isinstance(x,bytes):
+        if not isinstance(x,unicode):
+            x = repr(x)
+        x = x.encode("utf-8")
+    return struct.unpack("<Q",hashlib.md5(x).digest()[0:8])[0]
+
+def _nphash64(a):
+    """Vectorized hash64 for numpy integer and float arrays"""
+    if a.dtype.kind == "f":
+        z = a.astype(numpy.float64).view(numpy.uint64)
+    else:
+        z = a.astype(numpy.int64).view(numpy.uint64)
+    z = (z ^ (z >> numpy.uint64(30)))*numpy.uint64(0xbf58476d1ce4e5b9)
+    z = (z ^ (z >> numpy.uint64(27)))*numpy.uint64(0x94d049bb133111eb)
+    return z ^ (z >> numpy.uint64(31))
+
+def _alpha(m):
+    if m == 16:
+        return 0.673
+    elif m == 32:
+        return 0.697
+    elif m == 64:
+        return 0.709
+    else:
+        return 0.7213/(1+1.079/m)
+
+
+class HyperLogLog:
+    """Fixed memory estimator of the number of distinct values"""
+    def __init__(self,p=12):
+        """Constructor with precision p in [4,16]: 2^p registers"""
+        if p < 4 or p > 16:
+            raise Exception("HyperLogLog precision must be in [4,16]")
+        self.p = p
+        self.m = 1 << p
+        self.reset()
+    def reset(self):
+        """Resets the sketch"""
+        self.registers = bytearray(self.m)
+    @property
+    def empty(self):
+        return not any(self.registers)
+    @property
+    def error(self):
+        """Returns the relative standard error of the estimate"""
+        return 1.04/math.sqrt(self.m)
+    def addhash(self,h):
+        """Adds a value given its 64 bit hash"""
+        q = 64-self.p
+        i = h >> q
+        w = h & ((1 << q)-1)
+        r = q-w.bit_length()+1
+        if r > self.registers[i]:
+            self.registers[i] = r
+    def append(self,x):
+        """Adds a new value"""
+        self.addhash(hash64(x))
+    def extend(self,data):
+        """Adds a sequence of values, numeric numpy arrays are hashed in vectorized form"""
+        if numpy is not None and isinstance(data,numpy.ndarray) and data.dtype.kind in "iuf":
+            self._extendnumpy(data.ravel())
+        else:
+            for x in data:
+                self.addhash(hash64(x))
+        return self
+    def _extendnumpy(self,data):
+        """Private: vectorized update from numeric array"""
+        if len(data) == 0:
+            return
+        q = 64-self.p
+        h = _nphash64(data)
+        idx = (h >> numpy.uint64(q)).astype(numpy.intp)
+        w = h & numpy.uint64((1 << q)-1)
+        # exact bit length by binary search over the shifts
+        bl = numpy.zeros(len(w),dtype=numpy.int64)
+        for s in (32,16,8,4,2,1):
+            big = w >= numpy.uint64(1 << s)
+            w = numpy.where(big,w >> numpy.uint64(s),w)
+            bl += big*s
+        bl += (w > 0)
+        r = (q-bl+1).astype(numpy.uint8)
+        regs = numpy.frombuffer(self.registers,dtype=numpy.uint8).copy()
+        numpy.maximum.at(regs,idx,r)
+        self.registers = bytearray(regs.tobytes())
+    @property
+    def cardinality(self):
+        """Returns the estimated number of distinct values"""
+        m = float(self.m)
+        z = 0.0
+        zeros = 0
+        for r in self.registers:
+            z += 2.0**(-r)
+            if r == 0:
+                zeros += 1
+        e = _alpha(self.m)*m*m/z
+        if e <= 2.5*m and zeros > 0:
+            # small range: linear counting
+            e = m*math.log(m/zeros)
+        return e
+    def __len__(self):
+        return int(round(self.cardinality))
+    def merge(self,other):
+        """Merges the other sketch: the result counts the union of the values"""
+        if other.p != self.p:
+            raise Exception("Cannot merge HyperLogLog with different precision")
+        self.registers = bytearray(max(a,b) for a,b in zip(self.registers,other.registers))
+        return self
+    def clone(self):
+        r = HyperLogLog(self.p)
+        r.copy(self)
+        return r
+    def copy(self,other):
+        """Assignment"""
+        self.p = other.p
+        self.m = other.m
+        self.registers = bytearray(other.registers)
+        return self
+    def tobytes(self):
+        """Serializes the sketch"""
+        return HEADER + struct.pack("BB",VERSION,self.p) + bytes(self.registers)
+    @staticmethod
+    def frombytes(data):
+        """Builds the sketch from the output of tobytes"""
+        data = bytes(data)
+        if data[0:3] != HEADER:
+            raise Exception("Not a HyperLogLog serialization")
+        version,p = struct.unpack("BB",data[3:5])
+        if version != VERSION:
+            raise Exception("Unsupported HyperLogLog version %d" % version)
+        r = HyperLogLog(p)
+        if len(data) != 5+r.m:
+            raise Exception("Truncated HyperLogLog serialization")
+        r.registers = bytearray(data[5:])
+        return r
+    def __str__(self):
+        return "HyperLogLog(p=%d,cardinality=%.0f)" % (self.p,self.cardinality)
@@ -18,8 +18,17 @@
 # Standardized Moments: scale invariant because is mu_k/sigma^k
 # Skewness is sm of order 3, ku is sm of order 4
 #
+# Arbitrary order: the p-functions (pmoments*) work on tuples (n,mean,M2,...,Mp) of any order p >= 2,
+# the 5-tuple above is the p=4 case and pmomentscombine(mA,mB) == momentscombine(mA,mB)
+#
 # Initial Versiom: 31st December 2013
+from __future__ import print_function
 import math
+import struct
+try:
+    import numpy
+except:
+    numpy = None
 
 # moments of single value
 def momentsofscalar(x):
@@ -91,6 +100,36 @@ def momentsaddscalar(mA,x):
     m4X = mA[4]+delta4*(nA*(nAA-nA+1)/nXXX)+6*(delta2)*mA[2]/nXX-4*delta*mA[3]/nX
     return (mA[0]+1,m1X,m2X,m3X,m4X)
 
+# removes moments mB from mA, inverse of momentscombine:
+# momentsuncombine(momentscombine(mA,mB),mB) == mA
+# mB has to be a part of the data summarized by mX
+def momentsuncombine(mX,mB):
+    nX = float(mX[0])
+    nB = float(mB[0])
+    nA = nX-nB
+    if nB == 0:
+        return mX
+    elif nA <= 0:
+        if nA < 0:
+            raise Exception("Cannot uncombine moments with more items")
+        return momentsempty()
+    m1A = (nX*mX[1]-nB*mB[1])/nA
+    delta = float(mB[1]-m1A)
+    delta2 = delta**2
+    delta3 = delta2*delta
+    delta4 = delta3*delta
+    nAB = nA*nB
+    nAA = nA*nA
+    nBB = nB*nB
+    nXX = nX*nX
+    nXXX = nXX*nX
+    # same terms of momentscombine solved from the lowest order
+    m2A = max(mX[2]-mB[2]-delta2*nAB/nX,0.0)
+    m3A = mX[3]-mB[3]-delta3*(nAB*(nA-nB))/nXX - 3*delta*(nA*mB[2]-nB*m2A)/nX
+    m4A = mX[4]-mB[4]-delta4*(nAB*(nAA-nAB+nBB)/nXXX)-6*(delta2)*(nAA*mB[2]+nBB*m2A)/nXX-4*delta*(nA*mB[3]-nB*m3A)/nX
+    m4A = max(m4A,0.0)
+    return (mX[0]-mB[0],m1A,m2A,m3A,m4A)
+
 # converts the moments tuple to statistics as dictionary
 def moments2stat(mA):
     n,mean,M2,M3,M4 = mA
@@ -152,6 +191,308 @@ def momentsfromdata(data):
     return (len(data),mean,M2,M3,M4)
 
 
+# binomial table C[q][j] for q,j in 0..p, cached by order
+_binomials = {}
+def binomials(p):
+    C = _binomials.get(p)
+    if C is None:
+        C = [[0]*(p+1) for q in range(0,p+1)]
+        for q in range(0,p+1):
+            C[q][0] = 1
+            for j in range(1,q+1):
+                C[q][j] = C[q-1][j-1] + C[q-1][j]
+        _binomials[p] = C
+    return C
+
+# moments of order p of single value
+def pmomentsofscalar(x,p):
+    return (1,x) + (0,)*(p-1)
+
+def pmomentsempty(p):
+    return (0,0) + (0,)*(p-1)
+
+# order of the moments tuple
+def pmomentsorder(mA):
+    return len(mA)-1
+
+# update moments of order p as of: s*x with s scalar
+def pmomentsscale(mA,s):
+    return (mA[0],s*mA[1]) + tuple((s**k)*mA[k] for k in range(2,len(mA)))
+
+# update moments of order p as of: x+t
+def pmomentstranslate(mA,t):
+    return (mA[0],mA[1]+t) + tuple(mA[2:])
+
+# combines two moments of order p
+#
+# based on Pebay, Philippe (2008), Formulas for Robust, One-Pass Parallel Computation of Covariances
+# and Arbitrary-Order Statistical Moments. Writing x-mX = (x-mA) - nB/nX delta the binomial expansion gives
+#   Mq(X) = sum_j C(q,j) [ Mj(A) (-nB delta/nX)^(q-j) + Mj(B) (nA delta/nX)^(q-j) ]
+# with M0 = n and M1 = 0, that is Pebay's formula evaluated as a product with the binomial table
+def pmomentscombine(mA,mB):
+    p = len(mA)-1
+    if len(mB) != p+1:
+        raise Exception("Cannot combine moments of different order")
+    if mB[0] == 0:
+        return mA
+    elif mA[0] == 0:
+        return mB
+    nA = float(mA[0])
+    nB = float(mB[0])
+    nX = nA+nB
+    delta = float(mB[1]-mA[1])
+    dA = -nB*delta/nX
+    dB = nA*delta/nX
+    m1X = mA[1]-dA
+    C = binomials(p)
+    SA = (nA,0.0) + tuple(mA[2:])
+    SB = (nB,0.0) + tuple(mB[2:])
+    powA = [1.0]
+    powB = [1.0]
+    for k in range(1,p+1):
+        powA.append(powA[-1]*dA)
+        powB.append(powB[-1]*dB)
+    r = [mA[0]+mB[0],m1X]
+    for q in range(2,p+1):
+        Cq = C[q]
+        r.append(sum(Cq[j]*(SA[j]*powA[q-j] + SB[j]*powB[q-j]) for j in range(0,q+1)))
+    return tuple(r)
+
+# combines many pairs of moments of order p at once (requires numpy)
+# MA and MB are arrays (p+1,N): one column (n,mean,M2,...,Mp) per state, returns the (p+1,N) array
+def pmomentscombinearray(MA,MB):
+    MA = numpy.asarray(MA,dtype=numpy.float64)
+    MB = numpy.asarray(MB,dtype=numpy.float64)
+    p = MA.shape[0]-1
+    C = binomials(p)
+    nA = MA[0]
+    nB = MB[0]
+    nX = nA+nB
+    safe = numpy.where(nX > 0,nX,1.0)
+    delta = numpy.where((nA > 0) & (nB > 0),MB[1]-MA[1],0.0)
+    dA = -nB*delta/safe
+    dB = nA*delta/safe
+    SA = MA.copy()
+    SB = MB.copy()
+    SA[1] = 0
+    SB[1] = 0
+    powA = numpy.ones((p+1,)+nA.shape)
+    powB = numpy.ones((p+1,)+nA.shape)
+    for k in range(1,p+1):
+        powA[k] = powA[k-1]*dA
+        powB[k] = powB[k-1]*dB
+    R = numpy.empty_like(MA)
+    R[0] = nX
+    R[1] = numpy.where(nA > 0,MA[1]-dA,MB[1])
+    for q in range(2,p+1):
+        R[q] = sum(C[q][j]*(SA[j]*powA[q-j] + SB[j]*powB[q-j]) for j in range(0,q+1))
+    return R
+
+# adds scalar to moments of order p
+def pmomentsaddscalar(mA,x):
+    return pmomentscombine(mA,pmomentsofscalar(x,len(mA)-1))
+
+# given sequence of number computes moments of order p at once, vectorized with numpy
+def pmomentsfromdata(data,p):
+    n = len(data)
+    if n == 0:
+        return pmomentsempty(p)
+    if numpy is not None:
+        d = numpy.asarray(data,dtype=numpy.float64).ravel()
+        mean = d.mean()
+        d = d-mean
+        r = [n,float(mean)]
+        dk = d*d
+        for k in range(2,p+1):
+            if k > 2:
+                dk *= d
+            r.append(float(dk.sum()))
+        return tuple(r)
+    nf = float(n)
+    mean = 0
+    for x in data:
+        mean += x/nf
+    M = [0.0]*(p+1)
+    for x in data:
+        d = x-mean
+        dk = d
+        for k in range(2,p+1):
+            dk *= d
+            M[k] += dk
+    return (n,mean) + tuple(M[2:])
+
+# updates moments of order p with a batch of data
+def pmomentsextend(mA,data):
+    return pmomentscombine(mA,pmomentsfromdata(data,len(mA)-1))
+
+# standardized moments [mu3/sigma^3,...,mup/sigma^p] with population sigma: skewness, kurtosis, ...
+# all zero for empty or constant data, as in LiveStat
+def pmoments2standardized(mA):
+    if mA[0] == 0 or mA[2] <= 0:
+        return [0.0]*(len(mA)-3)
+    nf = float(mA[0])
+    mu2 = mA[2]/nf
+    return [(mA[k]/nf)/(mu2**(k/2.0)) for k in range(3,len(mA))]
+
+# cumulants [k1,...,kp] (population) from the central moments mu_q = Mq/n:
+#   k_q = mu_q - sum_{m=2}^{q-2} C(q-1,m-1) k_m mu_(q-m)     (mu_1 = 0 for central moments)
+# k1 is the mean, k2 the variance (population), k3 = mu3, k4 = mu4 - 3 mu2^2
+# empty moments give zero cumulants
+def pmoments2cumulants(mA):
+    p = len(mA)-1
+    if mA[0] == 0:
+        return [mA[1]] + [0.0]*(p-1)
+    nf = float(mA[0])
+    mu = [1.0,0.0] + [mA[k]/nf for k in range(2,p+1)]
+    C = binomials(p)
+    k = [0.0]*(p+1)
+    for q in range(2,p+1):
+        k[q] = mu[q] - sum(C[q-1][m-1]*k[m]*mu[q-m] for m in range(2,q-1))
+    k[1] = mA[1]
+    return k[1:]
+
+# central moments of order p from cumulants [k1,...,kp] and the count n, inverse of pmoments2cumulants
+#   mu_q = k_q + sum_{m=2}^{q-2} C(q-1,m-1) k_m mu_(q-m)
+def cumulants2pmoments(k,n):
+    p = len(k)
+    C = binomials(p)
+    kq = [0.0,0.0] + list(k[1:])
+    mu = [1.0,0.0] + [0.0]*(p-1)
+    for q in range(2,p+1):
+        mu[q] = kq[q] + sum(C[q-1][m-1]*kq[m]*mu[q-m] for m in range(2,q-1))
+    nf = float(n)
+    return (n,k[0]) + tuple(nf*mu[q] for q in range(2,p+1))
+
+# moments of X+Y (sign=1) or X-Y (sign=-1) for independent X and Y of any order p
+# cumulants are additive for independent variables: k_q(X+sY) = k_q(X) + s^q k_q(Y)
+# The count of the result is min(nX,nY) as in a pairwise z_i = x_i + s y_i
+def pmomentssum(mA,mB,sign=1):
+    if len(mA) != len(mB):
+        raise Exception("Cannot sum moments of different order")
+    if mA[0] == 0 or mB[0] == 0:
+        raise Exception("Cannot sum empty moments")
+    kA = pmoments2cumulants(mA)
+    kB = pmoments2cumulants(mB)
+    k = [kA[q-1] + (sign**q)*kB[q-1] for q in range(1,len(kA)+1)]
+    return cumulants2pmoments(k,min(mA[0],mB[0]))
+
+# moments of X+Y for independent X and Y, (n,mean,M2,M3,M4) tuples:
+#   mu2 = k2, mu3 = k3, mu4 = k4 + 3 k2^2 with k4 = mu4 - 3 mu2^2
+def momentssum(mA,mB):
+    return pmomentssum(mA,mB,1)
+
+# moments of X-Y for independent X and Y: odd cumulants of Y change sign
+def momentsdifference(mA,mB):
+    return pmomentssum(mA,mB,-1)
+
+# Buffers: objects exporting the buffer protocol (array.array, memoryview, bytes, bytearray) are
+# processed in place with numpy when present, otherwise in blocks of values decoded by
+# memoryview.cast (Python 3, native formats) or struct.unpack_from, combining the block moments
+BLOCKSIZE = 4096
+_castformats = "bBhHiIlLqQfd"
+
+# true for objects handled as buffers (numpy arrays are not)
+def isbuffer(data):
+    if numpy is not None and isinstance(data,numpy.ndarray):
+        return False
+    if isinstance(data,(bytes,bytearray,memoryview)) or hasattr(data,"typecode"):
+        return True
+    try:
+        memoryview(data)
+        return True
+    except TypeError:
+        return False
+
+# struct format of the buffer: explicit fmt, array typecode or memoryview format
+def bufferformat(data,fmt=None):
+    if fmt is not None:
+        return fmt
+    if hasattr(data,"typecode"):
+        return data.typecode
+    if hasattr(data,"format"):
+        return data.format
+    return memoryview(data).format
+
+def _buffernbytes(data):
+    try:
+        mv = memoryview(data)
+    except TypeError:
+        # Python 2 array.array only has the old buffer interface
+        return len(buffer(data))
+    if hasattr(mv,"nbytes"):
+        return mv.nbytes
+    return len(mv)*mv.itemsize
+
+# numpy dtype of a struct format, None when numpy is missing or the format has no exact equivalent
+# struct byte orders "!" (network) and "@" (native) are ">" and "=" in numpy, and the item size has
+# to match since e.g. "<l" is 4 bytes for struct but a C long for numpy
+def _numpydtype(fmt):
+    if numpy is None:
+        return None
+    npfmt = {"!":">","@":"="}.get(fmt[0],fmt[0]) + fmt[1:]
+    try:
+        dtype = numpy.dtype(npfmt)
+    except TypeError:
+        return None
+    if dtype.itemsize != struct.calcsize(fmt):
+        return None
+    return dtype
+
+# iterates over the values of a buffer in blocks of at most block values, without converting it
+# to a list. With numpy a single array viewing the buffer is produced
+def iterbuffer(data,fmt=None,block=BLOCKSIZE):
+    fmt = bufferformat(data,fmt)
+    dtype = _numpydtype(fmt)
+    if dtype is not None:
+        try:
+            yield numpy.frombuffer(data,dtype=dtype)
+        except AttributeError:
+            # Python 2 numpy.frombuffer does not take memoryview, asarray gives a view
+            yield numpy.frombuffer(numpy.asarray(data),dtype=dtype)
+        return
+    size = struct.calcsize(fmt)
+    n = _buffernbytes(data)//size
+    mv = None
+    if fmt in _castformats:
+        try:
+            mv = memoryview(data).cast("B").cast(fmt)
+        except (TypeError,AttributeError):
+            mv = None
+    if mv is not None:
+        for i in range(0,n,block):
+            yield mv[i:i+block]
+        return
+    order = fmt[0] if fmt[0] in "@=<>!" else ""
+    code = fmt[len(order):]
+    for i in range(0,n,block):
+        k = min(block,n-i)
+        yield struct.unpack_from("%s%d%s" % (order,k,code),data,i*size)
+
+# moments of order p of a buffer (see iterbuffer) computed by blocks
+# with withrange returns (moments,min,max), min and max being None for empty buffers
+def momentsfrombuffer(data,fmt=None,p=4,withrange=False):
+    m = pmomentsempty(p)
+    vmin = None
+    vmax = None
+    for b in iterbuffer(data,fmt):
+        if len(b) == 0:
+            continue
+        m = pmomentscombine(m,pmomentsfromdata(b,p))
+        if withrange:
+            if numpy is not None and isinstance(b,numpy.ndarray):
+                bmin = b.min().item()
+                bmax = b.max().item()
+            else:
+                bmin = min(b)
+                bmax = max(b)
+            if vmin is None or bmin < vmin:
+                vmin = bmin
+            if vmax is None or bmax > vmax:
+                vmax = bmax
+    if withrange:
+        return m,vmin,vmax
+    return m
+
 # Jarque Beta Test of Guassianity based on kurtosis and skewness
 # REQUIRES chiinv
 def jarquebetatest(mA,alpha):
@@ -165,7 +506,7 @@ def jarquebetatest(mA,alpha):
 if __name__ == "__main__":
     X = [0.7481,-0.1924,0.8886,-0.7648,-1.4023,-1.4224,0.4882,-0.1774,-0.1961,1.4193]
     matstat = dict(count=len(X),mean=-0.0611,var=0.9162,skewness=-0.0658,kurtosis=1.9194,std=0.9572)
-    print "MATLAB",matstat
+    print("MATLAB",matstat)
     # kurtosis(X) = 1.9194
     # skewness(X) = -0.0658
     # var(X) = 0.9162
@@ -177,33 +518,110 @@ if __name__ == "__main__":
     # alpha=0.05;
     # h = jbtest(X,alpha)
     # chi2inv(1-alpha,2) < JB
-    print "full data"
+    print("full data")
     m = momentsfromdata(X)
-    print "- full:",moments2stat(m)
+    print("- full:",moments2stat(m))
 
-    print "combining two parts data"
-    map = momentsfromdata(X[0:len(X)/2])
-    mbp = momentsfromdata(X[len(X)/2:])
+    print("combining two parts data")
+    map = momentsfromdata(X[0:len(X)//2])
+    mbp = momentsfromdata(X[len(X)//2:])
     mabp = momentscombine(map,mbp)
-    print "- joint:",moments2stat(mabp)    
+    print("- joint:",moments2stat(mabp))
 
-    print "by scalar"
+    print("by scalar")
     mi = momentsempty()
     for x in X:
         mi = momentsaddscalar(mi,x)
-    print "- scalar:",moments2stat(mi)
+    print("- scalar:",moments2stat(mi))
 
-    print "combining two parts scalar"
+    print("combining two parts scalar")
     ma = momentsempty()
     mb = momentsempty()
-    for x in X[0:len(X)/2]:
+    for x in X[0:len(X)//2]:
         ma = momentsaddscalar(ma,x)
-    for x in X[len(X)/2:]:
+    for x in X[len(X)//2:]:
         mb = momentsaddscalar(mb,x)
     mab = momentscombine(ma,mb)
-    print "- scalar joint:",moments2stat(mab)
+    print("- scalar joint:",moments2stat(mab))
 
 
-    print "back op",m
+    print("back op",m)
     mr = stat2moments(moments2stat(m))
-    print "- back is",mr
+    print("- back is",mr)
+
+    print("buffers: numpy vs struct/memoryview")
+    Y = X*50
+    for fmt in ("<d","!d","f","i"):
+        values = [int(y*100) for y in Y] if fmt == "i" else Y
+        data = struct.pack("%s%d%s" % (fmt[0:-1],len(values),fmt[-1]),*values)
+        mnp = momentsfrombuffer(data,fmt,withrange=True)
+        npsave = numpy
+        numpy = None
+        mst = momentsfrombuffer(data,fmt,withrange=True)
+        numpy = npsave
+        err = max(abs(a-b)/max(abs(a),1.0) for a,b in zip(mnp[0]+mnp[1:],mst[0]+mst[1:]))
+        print("-",fmt,"numpy" if numpy is not None else "no numpy","max relative difference",err)
+        assert err < 1e-9
+
+    def maxdiff(a,b):
+        return max(abs(x-y)/max(abs(x),1.0) for x,y in zip(a,b))
+
+    print("order p: combine vs full data")
+    A = X*3
+    B = [x*2+1 for x in X]
+    for p in (4,8):
+        mc = pmomentscombine(pmomentsfromdata(A,p),pmomentsfromdata(B,p))
+        err = maxdiff(mc,pmomentsfromdata(A+B,p))
+        print("- p",p,"max relative difference",err)
+        assert err < 1e-9
+    err = maxdiff(pmomentscombine(momentsfromdata(A),momentsfromdata(B)),momentscombine(momentsfromdata(A),momentsfromdata(B)))
+    print("- p 4 vs momentscombine",err)
+    assert err < 1e-9
+
+    if numpy is not None:
+        print("order p: combinearray vs combine")
+        parts = [(A[0:i],B[i:]) for i in range(0,len(X),3)]
+        MA = numpy.array([pmomentsfromdata(a,6) for a,b in parts]).T
+        MB = numpy.array([pmomentsfromdata(b,6) for a,b in parts]).T
+        R = pmomentscombinearray(MA,MB)
+        err = max(maxdiff(R[:,i],pmomentscombine(MA[:,i],MB[:,i])) for i in range(0,len(parts)))
+        print("- max relative difference",err)
+        assert err < 1e-9
+
+    print("cumulants round trip")
+    m8 = pmomentsfromdata(A+B,8)
+    err = maxdiff(cumulants2pmoments(pmoments2cumulants(m8),m8[0]),m8)
+    print("- max relative difference",err)
+    assert err < 1e-9
+
+    print("uncombine")
+    mu = momentsuncombine(momentscombine(momentsfromdata(A),momentsfromdata(B)),momentsfromdata(B))
+    err = maxdiff(mu,momentsfromdata(A))
+    print("- max relative difference",err)
+    assert err < 1e-9
+
+    print("sum and difference of independent variables vs all the pairs")
+    for sign,f in ((1,momentssum),(-1,momentsdifference)):
+        ms = f(momentsfromdata(A),momentsfromdata(B))
+        mp = momentsfromdata([a+sign*b for a in A for b in B])
+        err = maxdiff([ms[1]]+[ms[k]/ms[0] for k in range(2,5)],[mp[1]]+[mp[k]/mp[0] for k in range(2,5)])
+        print("-",sign,"max relative difference",err)
+        assert err < 1e-9
+
+    print("degenerate: constant and empty data")
+    mc = pmomentsfromdata([1.0,1.0],6)
+    print("- constant",pmoments2standardized(mc),pmoments2cumulants(mc))
+    assert pmoments2standardized(mc) == [0.0]*4
+    assert pmoments2cumulants(mc) == [1.0] + [0.0]*5
+    print("- constant sum",momentssum(momentsfromdata([1.0,1.0]),momentsfromdata([2.0])))
+    assert momentssum(momentsfromdata([1.0,1.0]),momentsfromdata([2.0])) == (1,3.0,0.0,0.0,0.0)
+    me = pmomentsempty(6)
+    print("- empty",pmoments2standardized(me),pmoments2cumulants(me))
+    assert pmoments2standardized(me) == [0.0]*4
+    assert pmoments2cumulants(me) == [0] + [0.0]*5
+    try:
+        momentssum(momentsempty(),momentsfromdata(X))
+        assert False
+    except Exception as e:
+        print("- empty sum:",e)
+        assert "empty" in str(e)
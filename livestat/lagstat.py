@@ -0,0 +1,218 @@
+#
+# Streaming autocorrelation
+#
+# LagStat keeps the lag-1..K co-moments of a series online using the last K values:
+#   P_k = sum z_t z_{t+k}, A_k = sum z_t, B_k = sum z_{t+k}, N_k = number of pairs
+# where z = x-c is shifted by the first value c to limit cancellation. Then with m = mean(z):
+#   gamma_k = (P_k - m (A_k+B_k) + N_k m^2)/n
+#   rho_k = gamma_k/gamma_0
+# which is the usual (biased) sample autocorrelation estimator.
+#
+# All the sums are additive, so LagStat objects of independent segments can be merged.
+# With contiguous=True the pairs across the boundary are added using the first K values of
+# the second segment (head), head stops at the first break of the series (resetlast).
+from collections import deque
+try:
+    from scipy.stats.distributions import chi2
+except:
+    chi2 = None
+try:
+    import numpy
+except:
+    numpy = None
+
+
+class LagStat:
+    """LagStat computes autocovariance and autocorrelation up to lag maxlag over a stream"""
+    def __init__(self,maxlag):
+        """Constructor with the maximum lag"""
+        if maxlag < 1:
+            raise Exception("LagStat requires maxlag >= 1")
+        self.maxlag = maxlag
+        self.reset()
+    def reset(self):
+        """Resets the accumulator"""
+        self.n = 0
+        self.c = 0.0
+        self.s1 = 0.0
+        self.s2 = 0.0
+        self.p = [0.0]*self.maxlag
+        self.a = [0.0]*self.maxlag
+        self.b = [0.0]*self.maxlag
+        self.npairs = [0]*self.maxlag
+        self.head = []
+        self.headopen = True
+        self.tail = deque(maxlen=self.maxlag)
+    def resetlast(self):
+        """Breaks the series: the next value is not paired with the previous ones"""
+        self.tail.clear()
+        self.headopen = False
+    @property
+    def count(self):
+        return self.n
+    @property
+    def empty(self):
+        return self.n == 0
+    @property
+    def mean(self):
+        if self.n == 0:
+            return None
+        return self.c + self.s1/self.n
+    def append(self,x):
+        """Appends a new item of the series"""
+        if self.n == 0:
+            self.c = float(x)
+        z = x-self.c
+        tail = self.tail
+        c = self.c
+        for k in range(1,len(tail)+1):
+            y = tail[-k]-c
+            self.p[k-1] += y*z
+            self.a[k-1] += y
+            self.b[k-1] += z
+            self.npairs[k-1] += 1
+        self.s1 += z
+        self.s2 += z*z
+        self.n += 1
+        if self.headopen and len(self.head) < self.maxlag:
+            self.head.append(x)
+        tail.append(x)
+    def extend(self,data):
+        """Appends a sequence of items, vectorized when numpy is available"""
+        if numpy is None:
+            for x in data:
+                self.append(x)
+            return self
+        data = numpy.asarray(data,dtype=numpy.float64).ravel()
+        if len(data) == 0:
+            return self
+        if self.n == 0:
+            self.c = float(data[0])
+        z = data-self.c
+        r = len(self.tail)
+        full = numpy.concatenate((numpy.array(self.tail,dtype=numpy.float64)-self.c,z))
+        m = len(full)
+        for k in range(1,self.maxlag+1):
+            # pairs (i,i+k) whose second element is new
+            i0 = max(r-k,0)
+            if i0+k >= m:
+                break
+            first = full[i0:m-k]
+            second = full[i0+k:m]
+            self.p[k-1] += float(numpy.dot(first,second))
+            self.a[k-1] += float(first.sum())
+            self.b[k-1] += float(second.sum())
+            self.npairs[k-1] += len(first)
+        self.s1 += float(z.sum())
+        self.s2 += float(numpy.dot(z,z))
+        self.n += len(z)
+        if self.headopen and len(self.head) < self.maxlag:
+            self.head.extend(data[0:self.maxlag-len(self.head)].tolist())
+        self.tail.extend(data[-self.maxlag:].tolist())
+        return self
+    def autocovariance(self,k):
+        """Returns the autocovariance at lag k (k=0 is the population variance). None if no pairs"""
+        if self.n == 0:
+            return None
+        m = self.s1/self.n
+        if k == 0:
+            return self.s2/self.n - m*m
+        if k > self.maxlag:
+            raise Exception("Lag %d above maxlag %d" % (k,self.maxlag))
+        if self.npairs[k-1] == 0:
+            return None
+        return (self.p[k-1] - m*(self.a[k-1]+self.b[k-1]) + self.npairs[k-1]*m*m)/self.n
+    def autocorrelation(self,k):
+        """Returns the autocorrelation at lag k. None if not available"""
+        g0 = self.autocovariance(0)
+        gk = self.autocovariance(k)
+        if gk is None or not g0 > 0:
+            return None
+        return gk/g0
+    def acf(self):
+        """Returns the list of autocorrelations for lags 1..maxlag"""
+        return [self.autocorrelation(k) for k in range(1,self.maxlag+1)]
+    def ljungbox(self,h=None):
+        """Returns the Ljung-Box statistics over lags 1..h (default maxlag) and the p-value
+
+        Q = n(n+2) sum_k rho_k^2/(n-k), compared against chi2 with h degrees of freedom"""
+        if h is None:
+            h = self.maxlag
+        n = float(self.n)
+        Q = 0.0
+        for k in range(1,h+1):
+            rk = self.autocorrelation(k)
+            if rk is None or n <= k:
+                continue
+            Q += rk*rk/(n-k)
+        Q *= n*(n+2)
+        if chi2 is None:
+            p = "scipy missing"
+        else:
+            p = 1 - chi2.cdf(Q,h)
+        return Q,p
+    def merge(self,other,contiguous=False):
+        """Merges the other statistics
+
+        By default the two series are independent segments. With contiguous=True other is the
+        continuation of this series and the pairs across the boundary are added"""
+        if other.maxlag != self.maxlag:
+            raise Exception("Cannot merge LagStat with different maxlag")
+        if other.n == 0:
+            return self
+        if self.n == 0:
+            self.copy(other)
+            return self
+        # bring the sums of other to the shift of self: z_self = z_other + d
+        d = other.c-self.c
+        self.s2 += other.s2 + 2*d*other.s1 + other.n*d*d
+        self.s1 += other.s1 + other.n*d
+        for i in range(0,self.maxlag):
+            self.p[i] += other.p[i] + d*(other.a[i]+other.b[i]) + other.npairs[i]*d*d
+            self.a[i] += other.a[i] + other.npairs[i]*d
+            self.b[i] += other.b[i] + other.npairs[i]*d
+            self.npairs[i] += other.npairs[i]
+        if contiguous:
+            prev = list(self.tail)
+            t = len(prev)
+            full = prev + list(other.head)
+            for i in range(0,t):
+                for j in range(t,min(i+self.maxlag,len(full)-1)+1):
+                    y = full[i]-self.c
+                    z = full[j]-self.c
+                    self.p[j-i-1] += y*z
+                    self.a[j-i-1] += y
+                    self.b[j-i-1] += z
+                    self.npairs[j-i-1] += 1
+            if other.headopen:
+                self.tail.extend(other.tail)
+            else:
+                self.tail = deque(other.tail,maxlen=self.maxlag)
+            if self.headopen and len(self.head) < self.maxlag:
+                self.head.extend(other.head[0:self.maxlag-len(self.head)])
+            self.headopen = self.headopen and other.headopen
+        self.n += other.n
+        return self
+    def clone(self):
+        r = LagStat(self.maxlag)
+        r.copy(self)
+        return r
+    def copy(self,other):
+        """Assignment"""
+        self.maxlag = other.maxlag
+        self.n = other.n
+        self.c = other.c
+        self.s1 = other.s1
+        self.s2 = other.s2
+        self.p = list(other.p)
+        self.a = list(other.a)
+        self.b = list(other.b)
+        self.npairs = list(other.npairs)
+        self.head = list(other.head)
+        self.headopen = other.headopen
+        self.tail = deque(other.tail,maxlen=other.maxlag)
+        return self
+    def __str__(self):
+        if self.n == 0:
+            return "LagStat(maxlag=%d,empty)" % self.maxlag
+        return "LagStat(maxlag=%d,acf=%s,count=%d)" % (self.maxlag,self.acf(),self.n)
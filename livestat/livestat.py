@@ -20,6 +20,10 @@
 
 from collections import defaultdict
 import math
+from heavyhitters import SpaceSaving
+from hyperloglog import HyperLogLog
+import incmoments
+from lagstat import LagStat
 try:
     from scipy.stats.distributions import chi2
 except:
@@ -36,11 +40,22 @@ class LiveStat:
         """Constructor with optional name, used for printing"""
         self.name = name
         self.dirty = False
+        self.distinct = None
         self.reset()
     @property
     def empty(self):
         """Returns true when there is no data"""
         return self.vcount == 0
+    def trackdistinct(self,p=12):
+        """Enables the approximate count of distinct values with a HyperLogLog of precision p"""
+        self.distinct = HyperLogLog(p)
+        return self
+    @property
+    def distinctcount(self):
+        """Returns the estimated number of distinct values. None if not tracked"""
+        if self.distinct is None:
+            return None
+        return self.distinct.cardinality
     @property
     def count(self):
         """Returns the number of items seen by the accumulator"""
@@ -92,8 +107,8 @@ class LiveStat:
         return self.vmean
     @property
     def span(self):
-        """Returns the range of values. None if no items"""
-        if self.vcount == 0:
+        """Returns the range of values. None if no items or range unknown (after unmerge)"""
+        if self.vcount == 0 or self.vmin is None:
             return None
         else:
             return self.vmax-self.vmin
@@ -127,6 +142,8 @@ class LiveStat:
 
         self.vcount = 0
         self.vcountsq = 0
+        if self.distinct is not None:
+            self.distinct.reset()
 
         # computed variables
         self.dirty = False
@@ -162,10 +179,12 @@ class LiveStat:
         if isinstance(value,LiveStat):
             raise Exception ("Product of Statistics is not supported")
         else:
-            if self.vmin is not None:
+            if self.vcount > 0:
                 # mu(s x) = 1/N sum s x = s/N sum x
                 self.vmean *= value
-                if value < 0:
+                if self.vmin is None:
+                    pass
+                elif value < 0:
                     m = self.vmin
                     M = self.vmax
                     self.vmin = M*value
@@ -174,9 +193,10 @@ class LiveStat:
                     self.vmin *= value
                     self.vmax *= value
                 self.vsum *= value
+                # central moments are homogeneous: Mk(s x) = s^k Mk(x)
                 self.vm2 *= value*value
-                print ("div Missing: M3 and M4")
-                # no effect on vm4
+                self.vm3 *= value**3
+                self.vm4 *= value**4
                 self.dirty = True
         return self
 
@@ -185,10 +205,12 @@ class LiveStat:
         if isinstance(value,LiveStat):
             raise Exception ("Ratio of Statistics is not supported")
         else:
-            if self.vmin is not None:
+            if self.vcount > 0:
                 # mu(s x) = 1/N sum s x = s/N sum x
                 self.vmean /= value
-                if value < 0:
+                if self.vmin is None:
+                    pass
+                elif value < 0:
                     m = self.vmin
                     M = self.vmax
                     self.vmin = M/value
@@ -199,25 +221,36 @@ class LiveStat:
                 self.vsum /= value
                 # vm2(s x) = sum (s x - mu(s x))^2 = sum (s x - s mu(x))^2 = sum s^2 (x - mu(x))^2 = s^2 sum (x - mu(x))^2 = s^2 vm^2
                 self.vm2 /= value*value
-                print ("div Missing: M3 and M4")
+                self.vm3 /= value**3
+                self.vm4 /= value**4
                 self.dirty = True
         return self
-    def extend(self,data):        
-        """Extend from sequence
+    __itruediv__ = __idiv__
+    def extend(self,data,fmt=None):        
+        """Extend from sequence, numpy array or object exporting the buffer protocol
 
-        TODO numpy array support
+        Buffers (array.array, memoryview, bytes) are read in place, fmt is the struct format
+        of the values when the buffer does not carry it (e.g. raw bytes): see incmoments.iterbuffer
         """
+        if incmoments.isbuffer(data):
+            return self._extendbuffer(data,fmt)
+        if numpy is not None and isinstance(data,numpy.ndarray):
+            return self._extendbuffer(data.ravel(),fmt)
         n = float(len(data))
         if n == 0:
             return self
+        if self.distinct is not None:
+            self.distinct.extend(data)
         M2 = 0
         M3 = 0
         M4 = 0
         mean = 0
+        vsum = 0
         vmin = None
         vmax = None
         for x in data:
             mean += x/n   
+            vsum += x
             if vmin is None:
                 vmax = x
                 vmin = x
@@ -234,6 +267,7 @@ class LiveStat:
         x.vmin = vmin
         x.vmax = vmax
         x.vmean = mean
+        x.vsum = vsum
         x.vm2 = M2
         x.vm3 = M3
         x.vm4 = M4
@@ -242,8 +276,31 @@ class LiveStat:
         x.dirty = True
         self.merge(x)
         return self
+    def _extendbuffer(self,data,fmt=None):
+        """Private: extend from buffer or numpy array, see incmoments.momentsfrombuffer"""
+        if numpy is not None and isinstance(data,numpy.ndarray):
+            m = incmoments.pmomentsfromdata(data,4)
+            vmin,vmax = (data.min().item(),data.max().item()) if len(data) > 0 else (None,None)
+            if self.distinct is not None:
+                self.distinct.extend(data)
+        else:
+            m,vmin,vmax = incmoments.momentsfrombuffer(data,fmt,withrange=True)
+            if self.distinct is not None:
+                for b in incmoments.iterbuffer(data,fmt):
+                    self.distinct.extend(b)
+        if m[0] == 0:
+            return self
+        x = LiveStat(self.name)
+        x.vcount,x.vmean,x.vm2,x.vm3,x.vm4 = m
+        x.vcountsq = x.vcount**2
+        x.vsum = x.vmean*x.vcount
+        x.vmin = vmin
+        x.vmax = vmax
+        x.dirty = True
+        self.merge(x)
+        return self
     def __add__(self,value):
-        """Addition operator: scalar applied to all terms x_i"""
+        """Addition operator: scalar applied to all terms x_i, or sum of independent variables"""
         x = self.clone()
         if isinstance(value,LiveStat):
             x.name = "(" + self.name + "+" + value.name + ")"
@@ -252,9 +309,13 @@ class LiveStat:
         x += value
         return x
     def __sub__(self,value):
-        """Subtraction operator: scalar applied to all terms x_i"""
+        """Subtraction operator: scalar applied to all terms x_i, or difference of independent variables
+
+        With a LiveStatSnapshot returns the statistics of the values appended after the snapshot"""
         x = self.clone()
-        if isinstance(value,LiveStat):
+        if isinstance(value,LiveStatSnapshot):
+            return x.unmerge(value)
+        elif isinstance(value,LiveStat):
             x.name = "(" + self.name + "-" + value.name + ")"
         else:
             x.name = "(" + self.name + "- scalar)"
@@ -278,73 +339,75 @@ class LiveStat:
             x.name = "(" + self.name + "/ scalar)"
         x /= value
         return x    
+    __truediv__ = __div__
     def __iadd__(self,value):
-        """Updates the statistics as if all the values were (x+scalar) or (x+value)"""
+        """Updates the statistics as if all the values were (x+scalar) or (x+value)
+
+        With a LiveStat the result describes the sum of two independent variables: cumulants
+        are additive so the population moments are exact and min/max are the bounds. Count
+        (the minimum of the two) and sum (mean*count) are nominal, not of real samples, and
+        variance is count/(count-1) times the sum of the population variances"""
         if isinstance(value,LiveStat):
-            raise Exception("Cannot sum statistics")
-            if value.vcount < 1 or self.vcount < 1:
-                raise Exception("Cannot sum empty statistics")
-            else:
-                # sum of two considered pairwise: z_i = stat(x_i + y_i)
-                #
-                # data have different weights due to number of samples.. TODO
-                self.vmin += value.vmin 
-                self.vmax += value.vmax
-                self.vmean += value.vmean
-                self.vsum += value.vsum
-                # variance is sum of variance?
-                self.vm2 += value.vm2
-                # TODO vm3 vm4
-                self.vcount = min(value.vcount,self.vcount)
-                self.vcountsq = self.vcount**2
-                self.dirty = True
-                print ("add Missing: M3 and M4")
+            self._sumindependent(value,1)
         else:
-            # constant bias
-            if self.vmin is not None:
-                self.vmin += value
-                self.vmax += value
+            # constant bias: central moments are translation invariant
+            if self.vcount > 0:
+                if self.vmin is not None:
+                    self.vmin += value
+                    self.vmax += value
                 self.vmean += value
                 self.vsum += self.vcount*value
-                print ("add Missing: M3 and M4")
                 self.dirty = True
         return self
     def __isub__(self,value):
-        """Updates the statistics as if all the values were (x-value) and (x-y)"""
-        if isinstance(value,LiveStat):
-            raise Exception("Cannot sum statistics")
-            if value.vcount < 1 or self.vcount < 1:
-                raise Exception("Cannot sum empty statistics")
-            else:
-                # sum of two considered pairwise: z_i = stat(x_i - y_i)
-                #
-                # data have different weights due to number of samples.. TODO
-                self.vmin = self.vmin-value.vmax
-                self.vmax = self.vmax-value.vmin
-                self.vmean -= value.vmean
-                self.vsum -= value.vsum
-                # variance is sum of variance in any case
-                self.vm2 += value.vm2
-                # TODO vm3 vm4
-                self.vcount = min(self.vcount,value.vcount)
-                self.vcountsq = self.vcount**2
-                self.dirty = True
-                print ("sub Missing: M3 and M4")
+        """Updates the statistics as if all the values were (x-value) and (x-y)
+
+        With a LiveStat the result describes the difference of two independent variables, with
+        nominal count and sum as in __iadd__.
+        With a LiveStatSnapshot it is equivalent to unmerge"""
+        if isinstance(value,LiveStatSnapshot):
+            return self.unmerge(value)
+        elif isinstance(value,LiveStat):
+            self._sumindependent(value,-1)
         else:
             # constant bias
-            if self.vmin is not None:
-                self.vmin -= value
-                self.vmax -= value
+            if self.vcount > 0:
+                if self.vmin is not None:
+                    self.vmin -= value
+                    self.vmax -= value
                 self.vmean -= value
                 self.vsum -= self.vcount*value
                 self.dirty = True
-                print ("sub Missing: M3 and M4")
-        return self    
+        return self
+    def _sumindependent(self,value,sign):
+        """Private: statistics of x + sign*y for independent x and y, see incmoments.momentssum"""
+        if value.vcount < 1 or self.vcount < 1:
+            raise Exception("Cannot sum empty statistics")
+        if self.vmin is None or value.vmin is None:
+            self.vmin = None
+            self.vmax = None
+        elif sign > 0:
+            self.vmin += value.vmin
+            self.vmax += value.vmax
+        else:
+            self.vmin,self.vmax = self.vmin-value.vmax,self.vmax-value.vmin
+        if sign > 0:
+            m = incmoments.momentssum(self.asmoments(),value.asmoments())
+        else:
+            m = incmoments.momentsdifference(self.asmoments(),value.asmoments())
+        self.vcount,self.vmean,self.vm2,self.vm3,self.vm4 = m
+        self.vcountsq = self.vcount**2
+        # nominal: no sample of count items exists
+        self.vsum = self.vmean*self.vcount
+        self.distinct = None
+        self.dirty = True
     def standardize(self):
         self._finalize()
         return (self - self.vmean)/(self.std if self.vcount > 1 else 1)
     def minmax_normalize(self):
         self._finalize()
+        if self.vmin is None:
+            raise Exception("Range unknown after unmerge")
         return (self - self.vmin)/(self.vmax-self.vmin if self.vcount > 1 else 1)
     def clone(self):
         r = LiveStat(self.name)
@@ -352,6 +415,7 @@ class LiveStat:
         return r
     def copy(self,other):
         """Assignment"""
+        self.distinct = other.distinct.clone() if other.distinct is not None else None
         if other.vcount == 0:
             self.reset()
         else:
@@ -369,6 +433,8 @@ class LiveStat:
         return self
     def append(self,x):
         """Appends a new item"""
+        if self.distinct is not None:
+            self.distinct.append(x)
         if self.empty:
             self.vcount = 1
             self.vcountsq = 1
@@ -389,34 +455,47 @@ class LiveStat:
             self.vcount = nX
             self.vcountsq = nXX
 
-            if x < self.vmin:
-                self.vmin = x
-            if x > self.vmax:
-                self.vmax = x
+            if self.vmin is not None:
+                if x < self.vmin:
+                    self.vmin = x
+                if x > self.vmax:
+                    self.vmax = x
 
             delta = x-self.vmean
             delta2 = delta**2
             delta3 = delta**3
             delta4 = delta**4
             self.vmean += delta/nX # incremental mean (good for vectorial)
-            self.vm3 += delta3*(nA*(nA-1))/nXX - 3*delta*self.vm2/nX
             self.vm4 += delta4*(nA*(nAA-nA+1))/nXXX + 6*delta2*(self.vm2)/nXX - 4*delta*self.vm3/nX
+            self.vm3 += delta3*(nA*(nA-1))/nXX - 3*delta*self.vm2/nX
             # note is done at end
             self.vm2 += delta2*nA/nX # incremental quadratic for variance (good for vectorial)
             self.vsum += x
 
             self.dirty = True
     def merge(self,other):
-        """Merges the current statistics with the other"""
-        if self.empty:            
+        """Merges the current statistics with the other
+
+        Distinct counts are merged only when both sides track them"""
+        if self.distinct is not None and other.distinct is not None:
+            self.distinct.merge(other.distinct)
+        if self.empty:
+            distinct = self.distinct
             self.copy(other)
+            if distinct is not None:
+                self.distinct = distinct
             return self
         elif other.empty:
             return self
-        if(other.vmin < self.vmin):
-            self.vmin = other.vmin
-        if(other.vmax > self.vmax):
-            self.vmax = other.vmax
+        if self.vmin is None or other.vmin is None:
+            # range not known after unmerge
+            self.vmin = None
+            self.vmax = None
+        else:
+            if(other.vmin < self.vmin):
+                self.vmin = other.vmin
+            if(other.vmax > self.vmax):
+                self.vmax = other.vmax
 
         nA = float(self.vcount)
         nB = float(other.vcount)
@@ -426,8 +505,8 @@ class LiveStat:
         nX = nA+nB
         nXX = nX**2 #nAA+nBB+2*nAB #nX**2 # actually (nA+nB)^2 = (nAA+nBB+2*nAB)
         nXXX = nXX*nX
-        self.vcount = nX
-        self.vcountsq = nXX
+        self.vcount = self.vcount+other.vcount
+        self.vcountsq = self.vcount**2
 
         self.vsum += other.vsum;
 
@@ -436,12 +515,55 @@ class LiveStat:
         delta2 = delta**2
         delta3 = delta**3
         delta4 = delta**4
-        self.vmean += delta*nB/nA
-        self.vm2 += other.vm2 + delta2*(nAB/nX)
-        self.vm3 += other.vm3 + delta3*(nAB*(nA-nB))/nXX + 3*delta*(nA*other.vm2-nB*self.vm2)/nX
+        self.vmean += delta*nB/nX
+        # higher orders first: they use the moments of A before the merge
         self.vm4 += other.vm4 + delta4*(nAB*(nAA-nAB+nBB))/nXXX + 6*delta2*(nAA*other.vm2+nBB*self.vm2)/nXX + 4*delta*(nA*other.vm3-nB*self.vm3)/nX
+        self.vm3 += other.vm3 + delta3*(nAB*(nA-nB))/nXX + 3*delta*(nA*other.vm2-nB*self.vm2)/nX
+        self.vm2 += other.vm2 + delta2*(nAB/nX)
+        self.dirty = True
+        return self
+    def unmerge(self,other):
+        """Removes from the current statistics the other ones, inverse of merge
+
+        other is a LiveStat or a LiveStatSnapshot whose data is contained in the current statistics.
+        The minimum and the maximum cannot be recovered: after unmerge they are None (unknown).
+        The distinct count, if tracked, is left untouched."""
+        if other.vcount > self.vcount:
+            raise Exception("Cannot unmerge statistics with more items")
+        if other.vcount == 0:
+            return self
+        if other.vcount == self.vcount:
+            self.vmin = None
+            self.vmax = None
+            self.vmean = None
+            self.vsum = None
+            self.vm2 = None
+            self.vm3 = None
+            self.vm4 = None
+            self.vcount = 0
+            self.vcountsq = 0
+            self.vvar = None
+            self.vkurtosis = None
+            self.vskewness = None
+            self.dirty = False
+            return self
+        mA = incmoments.momentsuncombine(self.asmoments(),(other.vcount,other.vmean,other.vm2,other.vm3,other.vm4))
+        self.vcount,self.vmean,self.vm2,self.vm3,self.vm4 = mA
+        self.vcountsq = self.vcount**2
+        self.vsum -= other.vsum
+        self.vmin = None
+        self.vmax = None
         self.dirty = True
         return self
+    def asmoments(self):
+        """Returns the moments tuple (n,mean,M2,M3,M4) as used by the incmoments module"""
+        if self.vcount == 0:
+            return incmoments.momentsempty()
+        return (self.vcount,self.vmean,self.vm2,self.vm3,self.vm4)
+    def snapshot(self):
+        """Returns a LiveStatSnapshot of the current statistics: (self - snapshot) gives the statistics
+        of the values appended after the snapshot"""
+        return LiveStatSnapshot(self)
     def asdict(self):
         self._finalize()
         prefix = self.name
@@ -457,39 +579,139 @@ class LiveStat:
         else:
             return "LiveStat(%sempty)" % np
 
+class LiveStatSnapshot:
+    """Frozen copy of the moments of a LiveStat, see LiveStat.snapshot
+
+    Only count, sum and moments are kept: min and max cannot be removed from a LiveStat"""
+    def __init__(self,stat):
+        self.name = stat.name
+        self.vcount = stat.vcount
+        self.vsum = stat.vsum
+        self.vmean = stat.vmean
+        self.vm2 = stat.vm2
+        self.vm3 = stat.vm3
+        self.vm4 = stat.vm4
+    @property
+    def count(self):
+        return self.vcount
+    def asmoments(self):
+        """Returns the moments tuple (n,mean,M2,M3,M4) as used by the incmoments module"""
+        if self.vcount == 0:
+            return incmoments.momentsempty()
+        return (self.vcount,self.vmean,self.vm2,self.vm3,self.vm4)
+    def __str__(self):
+        np = self.name
+        if np != "":
+            np += ","
+        return "LiveStatSnapshot(%smean=%s,count=%d)" % (np,self.vmean,self.vcount)
+
 class DeltaLiveStat(LiveStat):
-    """Specialization of the LiveStat that manages differential statistics"""
-    def __init__(self,name=""):
+    """Specialization of the LiveStat that manages differential statistics
+
+    With maxlag > 0 the autocorrelation of the differences up to maxlag is kept in lags (LagStat)"""
+    def __init__(self,name="",maxlag=0):
         self.last = None
         self.dlast = None
+        self.lags = LagStat(maxlag) if maxlag > 0 else None
         LiveStat.__init__(self,name)
     def reset(self):        
         """Reset"""
         self.last = None
+        if self.lags is not None:
+            self.lags.reset()
         LiveStat.reset(self)
     def resetlast(self):
         """Reset only the last, but not the inner statistics. Equivalent to adding None"""
         self.last = None
         self.dlast = 0
+        if self.lags is not None:
+            self.lags.resetlast()
     def clone(self):
         r = DeltaLiveStat(self.name)
         r.copy(self)
         return r
     def copy(self,other):
         LiveStat.copy(self,other)
-        self.last = other.last
-        self.dlast = other.dlast
+        self.last = getattr(other,"last",None)
+        self.dlast = getattr(other,"dlast",None)
+        lags = getattr(other,"lags",None)
+        self.lags = lags.clone() if lags is not None else None
+        return self
+    def merge(self,other,contiguous=False):
+        """Merges the current statistics with the other, lags are merged as independent segments
+        unless contiguous is True"""
+        if self.lags is not None and getattr(other,"lags",None) is not None:
+            self.lags.merge(other.lags,contiguous)
+        lags = self.lags
+        last = self.last
+        dlast = self.dlast
+        LiveStat.merge(self,other)
+        self.lags = lags
+        if contiguous and getattr(other,"last",None) is not None:
+            # other is the continuation of this series
+            self.last = other.last
+            self.dlast = other.dlast
+        elif not hasattr(other,"last"):
+            # plain LiveStat: the series of this object goes on
+            self.last = last
+            self.dlast = dlast
+        return self
+    def extend(self,data,fmt=None):
+        """Adds a sequence of items, as appending them one by one (None values are not supported)
+
+        The differences are computed with numpy.diff when numpy is available, buffers are read
+        in blocks as in LiveStat.extend"""
+        if incmoments.isbuffer(data):
+            blocks = incmoments.iterbuffer(data,fmt)
+        elif numpy is not None:
+            blocks = [numpy.asarray(data,dtype=numpy.float64).ravel()]
+        else:
+            blocks = [data]
+        for b in blocks:
+            self._extenddiffs(b)
         return self
+    def _extenddiffs(self,values):
+        """Private: differences of a block of values with respect to last, added to the moments and the lags"""
+        if numpy is not None:
+            x = numpy.asarray(values,dtype=numpy.float64)
+            if len(x) == 0:
+                return
+            if self.last is not None:
+                x = numpy.concatenate(([float(self.last)],x))
+            diffs = numpy.diff(x)
+            last = x[-1].item()
+        else:
+            last = self.last
+            diffs = []
+            for v in values:
+                if last is not None:
+                    diffs.append(float(v-last))
+                last = v
+        if len(diffs) > 0:
+            LiveStat.extend(self,diffs)
+            if self.lags is not None:
+                self.lags.extend(diffs)
+            self.dlast = float(diffs[-1])
+        elif self.last is None and last is not None:
+            self.dlast = 0
+        self.last = last
+    def autocorrelation(self,k):
+        """Returns the autocorrelation of the differences at lag k. None if lags are not tracked"""
+        if self.lags is None:
+            return None
+        return self.lags.autocorrelation(k)
     def append(self,x):
         """Adds a new item. If x is None this means to reset the input"""
         if x is None:
-            self.last = None
+            self.resetlast()
         elif self.last is None:
             self.last = x
             self.dlast = 0
         else:
             self.dlast = x-self.last
             LiveStat.append(self,float(self.dlast))
+            if self.lags is not None:
+                self.lags.append(float(self.dlast))
             self.last = x
     def __str__(self):
         self._finalize()
@@ -514,6 +736,11 @@ class Counter:
         return self.c == 0
     def append(self,x):
         self.c += x
+    def extend(self,xs):
+        self.c += sum(xs)
+    def merge(self,other):
+        self.c += other.c
+        return self
     def __str__(self):
         return str(self.c)
     def _finalize(self):
@@ -522,40 +749,131 @@ class Counter:
         self.c /= x
 
 class Histogram:
-    """Histogram Class"""
-    def __init__(self,name,cz=Counter):
+    """Histogram Class
+
+    With maxkeys the histogram keeps only the top maxkeys cases using a SpaceSaving summary,
+    bounding memory for high cardinality keys: see heavyhitters.SpaceSaving for the error bounds
+
+    With distinct=p the number of cases is estimated by a HyperLogLog of precision p. Without maxkeys
+    the cases are then not stored at all: only the count and the sketch are kept
+    """
+    def __init__(self,name,cz=Counter,maxkeys=None,distinct=None):
         self.name = name
         self.cz = cz
+        self.maxkeys = maxkeys
+        self.distinctp = distinct
+        self.distinct = None
         self.items = None
-        self.count = 0
+        self.vcount = 0
         self.reset()
     @property
     def empty(self):
-        return self.count == 0
+        return self.vcount == 0
+    @property
+    def bounded(self):
+        """Returns true when only the top maxkeys cases are tracked"""
+        return self.maxkeys is not None
+    @property
+    def countonly(self):
+        """Returns true when the cases are not stored, only counted by the distinct sketch"""
+        return self.items is None
     @property
     def casescount(self):
+        """Returns the number of cases, estimated when distinct counting is enabled"""
+        if self.distinct is not None:
+            return len(self.distinct)
         return len(self.items)
     @property
     def cases(self):
+        if self.countonly:
+            raise Exception("Histogram cases are not stored with distinct and no maxkeys")
         return sorted(self.items.keys())
+    @property
+    def outside(self):
+        """Returns the upper bound of the count not attributed to the tracked cases"""
+        if self.bounded:
+            return self.items.outside
+        return 0
+    def top(self,n=None):
+        """Returns the list of (case,count,error) sorted by decreasing count"""
+        if self.bounded:
+            return self.items.top(n)
+        elif self.countonly:
+            raise Exception("Histogram cases are not stored with distinct and no maxkeys")
+        r = sorted(((x,v.count,0) for x,v in self.items.items()),key=lambda q: -q[1])
+        if n is not None:
+            r = r[0:n]
+        return r
     def normalizetotal(self):
-        n = self.count
-        for v in self.items():
+        n = self.vcount
+        if self.countonly:
+            return
+        for v in self.items.values():
             v.divide(n)
     @property
     def count(self):
-        return self.count
+        return self.vcount
     def append(self,x,y=1):
-        self.items[x].append(y)
-        self.count += 1
+        if self.distinct is not None:
+            self.distinct.append(x)
+        if self.bounded:
+            self.items.append(x,y)
+        elif self.countonly:
+            pass
+        else:
+            self.items[x].append(y)
+        self.vcount += 1
+    def extend(self,xs,ys=None):
+        """Batch append of the cases xs with optional values ys (default 1 each)
+
+        xs can be any iterable, with numpy arrays aggregated by numpy.unique in bounded mode"""
+        if self.distinct is not None:
+            if not hasattr(xs,"__len__"):
+                xs = list(xs)
+            self.distinct.extend(xs)
+        if self.bounded:
+            total = self.items.total
+            self.items.extend(xs,ys)
+            self.vcount += self.items.total-total
+        elif self.countonly:
+            self.vcount += len(xs)
+        elif ys is None:
+            for x in xs:
+                self.items[x].append(1)
+                self.vcount += 1
+        else:
+            for x,y in zip(xs,ys):
+                self.items[x].append(y)
+                self.vcount += 1
+        return self
+    def merge(self,other):
+        """Merges the other histogram, for example coming from another worker"""
+        if self.bounded:
+            if not other.bounded:
+                raise Exception("Cannot merge unbounded Histogram into bounded one")
+            self.items.merge(other.items)
+        elif self.countonly:
+            if other.distinct is None:
+                raise Exception("Cannot merge Histogram without distinct into a count only one")
+        else:
+            if other.bounded or other.countonly:
+                raise Exception("Cannot merge bounded Histogram into unbounded one")
+            for x,v in other.items.items():
+                self.items[x].merge(v)
+        if self.distinct is not None and other.distinct is not None:
+            self.distinct.merge(other.distinct)
+        self.vcount += other.vcount
+        return self
     def reset(self):
-        self.items = defaultdict(self.cz)
-        self.count = 0
+        if self.bounded:
+            self.items = SpaceSaving(self.maxkeys,self.cz)
+        elif self.distinctp is not None:
+            self.items = None
+        else:
+            self.items = defaultdict(self.cz)
+        if self.distinctp is not None:
+            self.distinct = HyperLogLog(self.distinctp)
+        self.vcount = 0
     def _finalize(self):
         pass
 
-
-
-
-
-